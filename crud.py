@@ -1,12 +1,32 @@
-from sqlalchemy.orm import Session
+import uuid
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, selectinload
 from fastapi import HTTPException, status
-import models, schemas
+import models, schemas, services
+
+# -------------------------
+# Catalog version
+# -------------------------
+def ensure_catalog_version(db: Session):
+    if db.get(models.CatalogVersion, 1) is None:
+        db.add(models.CatalogVersion(id=1, token=uuid.uuid4().hex))
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()  # another worker created it first
+
+def bump_catalog_version(db: Session):
+    # call before commit so the new token lands atomically with the catalog change
+    db.execute(
+        update(models.CatalogVersion).where(models.CatalogVersion.id == 1).values(token=uuid.uuid4().hex)
+    )
 
 # -------------------------
 # Create / Get Diseases
 # -------------------------
 def get_disease_by_name(db: Session, name: str):
-    return db.query(models.Disease).filter(models.Disease.name == name).first()
+    return db.scalar(select(models.Disease).where(models.Disease.name == name))
 
 def create_disease(db: Session, name: str):
     disease = models.Disease(name=name)
@@ -19,7 +39,7 @@ def create_disease(db: Session, name: str):
 # Create / Get Breeds
 # -------------------------
 def get_breed_by_name(db: Session, name: str):
-    return db.query(models.Breed).filter(models.Breed.name == name).first()
+    return db.scalar(select(models.Breed).where(models.Breed.name == name))
 
 def create_breed(db: Session, breed_data: schemas.BreedCreateSchema):
     # ✅ Check species
@@ -31,33 +51,53 @@ def create_breed(db: Session, breed_data: schemas.BreedCreateSchema):
     if existing_breed:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Breed already exists.")
 
+    # ✅ Check prevalence (before touching the DB)
+    if not all(0 <= d.prevalence <= 1 for d in breed_data.diseases):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Prevalence must be between 0 and 1.")
+
     # ✅ Create breed
     breed = models.Breed(name=breed_data.name, species=breed_data.species)
     db.add(breed)
-    db.commit()
-    db.refresh(breed)
-
-    # ✅ Handle diseases
-    for d in breed_data.diseases:
-        if not (0 <= d.prevalence <= 1):
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Prevalence must be between 0 and 1.")
+    db.flush()  # assigns breed.id without committing
+    breed_id = breed.id  # read now: commit() expires the instance
 
-        disease = get_disease_by_name(db, d.disease_name)
-        if not disease:
-            disease = create_disease(db, d.disease_name)
+    # ✅ Handle diseases (one SELECT for existing, one bulk INSERT for missing)
+    names = [d.disease_name for d in breed_data.diseases]
+    if names:
+        existing = {
+            row.name: row.id
+            for row in db.execute(
+                select(models.Disease.id, models.Disease.name).where(models.Disease.name.in_(names))
+            )
+        }
+        missing = [n for n in dict.fromkeys(names) if n not in existing]
+        if missing:
+            result = db.execute(
+                insert(models.Disease).returning(models.Disease.id, models.Disease.name),
+                [{"name": n} for n in missing],
+            )
+            existing.update({row.name: row.id for row in result})
 
-        link = models.BreedDiseaseLink(breed_id=breed.id, disease_id=disease.id, prevalence=d.prevalence)
-        db.add(link)
+        # ✅ Bulk insert links
+        db.execute(
+            insert(models.BreedDiseaseLink),
+            [
+                {"breed_id": breed_id, "disease_id": existing[d.disease_name], "prevalence": d.prevalence}
+                for d in breed_data.diseases
+            ],
+        )
 
+    bump_catalog_version(db)
     db.commit()
-    db.refresh(breed)
-
-    # ✅ Build response
-    return schemas.BreedResponseSchema(
-        name=breed.name,
-        species=breed.species,
-        diseases=[
-            schemas.DiseaseResponseSchema(disease_name=d.disease.name, prevalence=d.prevalence)
-            for d in breed.diseases
-        ]
-    )
+    services.invalidate_similarity_matrix()
+    services.invalidate_risk_cache()
+
+    # ✅ Reload with links + diseases eager-loaded (breed SELECT + 2 batched selectin loads, no lazy loads)
+    breed = db.execute(
+        select(models.Breed)
+        .options(selectinload(models.Breed.diseases).selectinload(models.BreedDiseaseLink.disease))
+        .where(models.Breed.id == breed_id)
+    ).scalar_one()
+
+    # ✅ Response is validated from the ORM object (from_attributes)
+    return breed
@@ -4,7 +4,17 @@ from sqlalchemy.orm import sessionmaker
 
 DATABASE_URL = "sqlite:///./pets.db"
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    # QueuePool sized for concurrent risk-analysis requests (several queries each)
+    pool_size=20,
+    max_overflow=10,
+    pool_timeout=30,
+    pool_pre_ping=True,   # drop stale connections before use
+    pool_recycle=3600,
+    query_cache_size=1200,  # compiled-SQL LRU shared by all endpoints
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
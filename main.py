@@ -1,6 +1,6 @@
 from fastapi import FastAPI, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from database import engine, Base, get_db
+from database import engine, Base, SessionLocal, get_db
 import models, schemas
 import crud
 # main.py (only the endpoint; keep the rest as you already have)
@@ -8,6 +8,8 @@ import services
 
 # Create all DB tables
 Base.metadata.create_all(bind=engine)
+with SessionLocal() as _db:
+    crud.ensure_catalog_version(_db)
 
 app = FastAPI(title="Pet Breed & Disease Analysis API")
 
@@ -26,8 +28,8 @@ def create_breed(breed: schemas.BreedCreateSchema, db: Session = Depends(get_db)
 #     raise HTTPException(status_code=501, detail="Not implemented yet")
 
 @app.get("/breeds/risk_analysis", response_model=schemas.RiskAnalysisResponseSchema)
-def risk_analysis(breed_name: str, db: Session = Depends(get_db)):
-    return services.run_risk_analysis(db, breed_name)
+async def risk_analysis(breed_name: str, db: Session = Depends(get_db)):
+    return await services.run_risk_analysis(db, breed_name)
 
 # @app.get("/breeds/risk_analysis", response_model=schemas.RiskAnalysisResponseSchema)
 # def risk_analysis(breed_name: str, db: Session = Depends(get_db)):
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -8,7 +8,8 @@ class Breed(Base):
     name = Column(String, unique=True, index=True, nullable=False)
     species = Column(String, nullable=False)
 
-    diseases = relationship("BreedDiseaseLink", back_populates="breed")
+    # lazy="raise": callers must eager-load (e.g. selectinload) instead of N+1 lazy loads
+    diseases = relationship("BreedDiseaseLink", back_populates="breed", lazy="raise")
 
 class Disease(Base):
     __tablename__ = "diseases"
@@ -24,6 +25,23 @@ class BreedDiseaseLink(Base):
     prevalence = Column(Float, nullable=False)
 
     breed = relationship("Breed", back_populates="diseases")
-    disease = relationship("Disease", back_populates="breeds")
+    disease = relationship("Disease", back_populates="breeds", lazy="raise")
 
-    __table_args__ = (UniqueConstraint("breed_id", "disease_id"),)
+    @property
+    def disease_name(self) -> str:
+        # lets DiseaseResponseSchema validate straight from a link (disease must be eager-loaded)
+        return self.disease.name
+
+    __table_args__ = (
+        UniqueConstraint("breed_id", "disease_id"),
+        # reverse of the PK: disease -> breeds lookups in the similarity joins are index-only
+        Index("ix_bdl_disease_breed", "disease_id", "breed_id"),
+    )
+
+
+class CatalogVersion(Base):
+    # single row (id=1); writers replace the token in the same transaction as their data,
+    # so every worker's in-process caches can tell the catalog changed
+    __tablename__ = "catalog_version"
+    id = Column(Integer, primary_key=True)
+    token = Column(String, nullable=False)
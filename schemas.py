@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List
 
 # Disease schema inside a breed request
@@ -12,24 +12,29 @@ class BreedCreateSchema(BaseModel):
     diseases: List[DiseaseCreateSchema]
 
 class DiseaseResponseSchema(BaseModel):
+    model_config = ConfigDict(from_attributes=True)  # reads BreedDiseaseLink rows
+
     disease_name: str
     prevalence: float
 
 class BreedResponseSchema(BaseModel):
+    model_config = ConfigDict(from_attributes=True)  # allows returning SQLAlchemy objects
+
     name: str
     species: str
     diseases: List[DiseaseResponseSchema]
 
-    class Config:
-        orm_mode = True   # allows returning SQLAlchemy objects
-
 # Risk analysis output
 class SimilarBreedSchema(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     name: str
     species: str
     similarity: float
 
 class RiskAnalysisResponseSchema(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     target_breed: str
     similar_breeds: List[SimilarBreedSchema]
     shared_diseases: List[str]
@@ -1,4 +1,6 @@
 # seed.py
+import uuid
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from database import Base, engine, SessionLocal
 import models
@@ -51,29 +53,34 @@ def seed():
     db: Session = SessionLocal()
 
     # Add diseases
-    disease_objs = {}
-    for d in diseases:
-        obj = models.Disease(name=d)
-        db.add(obj)
-        disease_objs[d] = obj
-    db.commit()
+    result = db.execute(
+        insert(models.Disease).returning(models.Disease.id, models.Disease.name),
+        [{"name": d} for d in diseases],
+    )
+    disease_objs = {row.name: row.id for row in result}
 
     # Add breeds
-    breed_objs = {}
-    for b in breeds:
-        obj = models.Breed(name=b["name"], species=b["species"])
-        db.add(obj)
-        breed_objs[b["name"]] = obj
-    db.commit()
+    result = db.execute(
+        insert(models.Breed).returning(models.Breed.id, models.Breed.name),
+        [{"name": b["name"], "species": b["species"]} for b in breeds],
+    )
+    breed_objs = {row.name: row.id for row in result}
 
     # Add links
-    for breed_name, disease_name, prevalence in links:
-        link = models.BreedDiseaseLink(
-            breed_id=breed_objs[breed_name].id,
-            disease_id=disease_objs[disease_name].id,
-            prevalence=prevalence
-        )
-        db.add(link)
+    db.execute(
+        insert(models.BreedDiseaseLink),
+        [
+            {
+                "breed_id": breed_objs[breed_name],
+                "disease_id": disease_objs[disease_name],
+                "prevalence": prevalence,
+            }
+            for breed_name, disease_name, prevalence in links
+        ],
+    )
+
+    # New token: running servers drop their in-process caches even if the counts match
+    db.execute(insert(models.CatalogVersion), [{"id": 1, "token": uuid.uuid4().hex}])
 
     db.commit()
     db.close()
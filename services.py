@@ -1,10 +1,17 @@
 # services.py
-from typing import List, Dict, Tuple
+from collections import OrderedDict
+from itertools import islice
+from typing import List, Dict, NamedTuple, Optional, Tuple
 from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy import select, func, case, cast, desc, bindparam, Float, Integer, String
 from dotenv import load_dotenv
+import asyncio
+import difflib
+import json
 import os
+import threading
 import models, schemas
 
 # ---- Load .env once (for OPENAI_API_KEY) ----
@@ -12,78 +19,274 @@ load_dotenv()
 
 # ---- GPT-4o client (optional: only used when generating care plans) ----
 try:
-    from openai import OpenAI
-    _openai_client = OpenAI()  # uses OPENAI_API_KEY from env
+    from openai import AsyncOpenAI
+    _openai_client = AsyncOpenAI()  # uses OPENAI_API_KEY from env
 except Exception:
     _openai_client = None  # we’ll handle missing client gracefully
 
+_CARE_PLAN_MAX_TOKENS = 256  # latency scales with output tokens
+_CARE_PLAN_CACHE_SIZE = 256
+_care_plan_cache: OrderedDict = OrderedDict()  # (breed_name, diseases) -> plan
+
+# ---- Redis cache (optional: only used when REDIS_URL is set) ----
+_RISK_CACHE_TTL = 3600  # seconds
+_RISK_CACHE_VERSION_KEY = "risk:version"
+_REDIS_TIMEOUT = 0.5  # seconds; an unreachable Redis must not stall requests
+try:
+    import redis
+    _redis_client = redis.Redis.from_url(
+        os.environ["REDIS_URL"],
+        socket_timeout=_REDIS_TIMEOUT,
+        socket_connect_timeout=_REDIS_TIMEOUT,
+    )
+except Exception:
+    _redis_client = None  # no cache; every request is computed
+
+# ---- Fuzzy matcher for "Did you mean ...?" (rapidfuzz if installed, else difflib) ----
+try:
+    from rapidfuzz import process as _fuzz_process, fuzz as _fuzz
+except ImportError:
+    _fuzz_process = None
+
+# ---- In-process similarity (optional: numpy + scipy; otherwise the SQL query is used) ----
+try:
+    import numpy as np
+    from scipy.sparse import csr_matrix
+except ImportError:
+    np = None
+_MATRIX_MAX_BREEDS = 10_000  # larger catalogs stay on the SQL path
+
+_cache_lock = threading.Lock()  # guards the in-process caches below
+
+# ---- Breed names for 404 suggestions (loaded on a miss, keyed by catalog version) ----
+_breed_names: Optional[Tuple[Optional[str], List[str]]] = None  # (version, names)
+
+# ---- Breed x disease 0/1 matrix (loaded on first use, keyed by catalog version) ----
+_similarity_matrix = None  # Optional[(version, _SimilarityMatrix or False when the catalog is too big)]
+_similarity_generation = 0  # bumped by invalidate_similarity_matrix()
+
 
 # ---------- Helpers ----------
+def _all_breed_names(db: Session) -> List[str]:
+    global _breed_names
+    # version is read first, so a breed committed mid-load just triggers a reload next time
+    version = _catalog_version(db)
+    cached = _breed_names
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    names = list(db.scalars(select(models.Breed.name)))
+    with _cache_lock:
+        _breed_names = (version, names)
+    return names
+
+
+def _closest_breed_name(db: Session, breed_name: str) -> Optional[str]:
+    names = _all_breed_names(db)
+    if _fuzz_process:
+        match = _fuzz_process.extractOne(breed_name, names, scorer=_fuzz.ratio, score_cutoff=60)
+        return match[0] if match else None
+    suggestion = difflib.get_close_matches(breed_name, names, n=1)
+    return suggestion[0] if suggestion else None
+
+
 def _get_breed_by_name_or_404(db: Session, breed_name: str) -> models.Breed:
-    breed = db.query(models.Breed).filter(models.Breed.name == breed_name).first()
+    breed = db.scalar(select(models.Breed).where(models.Breed.name == breed_name))
     if not breed:
         # suggest the closest match
-        all_names = [b.name for b in db.query(models.Breed.name).all()]
-        import difflib
-        suggestion = difflib.get_close_matches(breed_name, all_names, n=1)
+        suggestion = _closest_breed_name(db, breed_name)
         msg = f"Breed '{breed_name}' not found."
         if suggestion:
-            msg += f" Did you mean '{suggestion[0]}'?"
+            msg += f" Did you mean '{suggestion}'?"
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=msg)
     return breed
 
 
+# ---------- Precompiled statements ----------
+# Built once at import with typed bind params, so every request reuses the same
+# cache key and the dialect-compiled SQL from the engine's compiled cache.
+_link = models.BreedDiseaseLink
+
+_TARGET_DISEASES_SQL = (
+    select(models.Disease.name, _link.prevalence, models.Disease.id)
+    .join(_link, models.Disease.id == _link.disease_id)
+    .where(_link.breed_id == bindparam("tid", type_=Integer))
+)
+
+
+def _build_similarity_sql():
+    # CASE instead of COUNT(*) FILTER (...) so SQLite < 3.30 works too
+    target_ids = select(_link.disease_id).where(_link.breed_id == bindparam("tid", type_=Integer))
+    inter = func.sum(case((_link.disease_id.in_(target_ids), 1), else_=0))
+    union = bindparam("tsize", type_=Integer) + func.count(_link.disease_id) - inter
+    raw = func.coalesce(cast(inter, Float) / func.nullif(union, 0), 0.0)
+    similarity = case(
+        (models.Breed.species == bindparam("tspecies", type_=String), raw),
+        (raw > 0.1, raw - 0.1),
+        else_=0.0,
+    ).label("similarity")
+    return (
+        select(models.Breed.name, models.Breed.species, similarity)
+        .select_from(models.Breed)
+        .outerjoin(_link, _link.breed_id == models.Breed.id)
+        .where(models.Breed.id != bindparam("tid", type_=Integer))
+        .group_by(models.Breed.id, models.Breed.name, models.Breed.species)
+        .order_by(desc("similarity"), models.Breed.id)
+        .limit(3)
+    )
+
+
+_SIMILARITY_SQL = _build_similarity_sql()
+
+# Catalog version shared by all workers: a token replaced by every catalog write
+# (crud.create_breed, seed.py), so reseeds with the same row counts are caught too
+_CATALOG_VERSION_SQL = select(models.CatalogVersion.token).where(models.CatalogVersion.id == 1)
+
+
+def _catalog_version(db: Session) -> Optional[str]:
+    return db.scalar(_CATALOG_VERSION_SQL)
+
+# expanding IN params: one cached statement for any list length
+_SHARED_DISEASES_SQL = (
+    select(models.Disease.name)
+    .join(_link, _link.disease_id == models.Disease.id)
+    .join(models.Breed, models.Breed.id == _link.breed_id)
+    .where(
+        models.Breed.name.in_(bindparam("names", expanding=True)),
+        _link.disease_id.in_(bindparam("ids", expanding=True)),
+    )
+    .distinct()
+)
+_IN_CHUNK_SIZE = 500  # keeps each statement under bind limits (SQLite 999, MSSQL 2100)
+
+
+def _chunked(it, n):
+    it = iter(it)
+    while batch := list(islice(it, n)):
+        yield batch
+
+
 def _fetch_target_diseases(db: Session, breed_id: int) -> List[Tuple[str, float, int]]:
     """
     Returns list of (disease_name, prevalence, disease_id) for the target breed.
     """
-    q = (
-        db.query(models.Disease.name, models.BreedDiseaseLink.prevalence, models.Disease.id)
-        .join(models.BreedDiseaseLink, models.Disease.id == models.BreedDiseaseLink.disease_id)
-        .filter(models.BreedDiseaseLink.breed_id == breed_id)
+    rows = db.execute(_TARGET_DISEASES_SQL, {"tid": breed_id}).all()
+    return [(name, prev, did) for (name, prev, did) in rows]
+
+
+def _top_similar_breeds_via_sql(
+    db: Session, target: models.Breed, target_size: int
+) -> List[schemas.SimilarBreedSchema]:
+    """
+    Computes Jaccard similarity on shared diseases in a single scan of the links:
+    |A ∩ B| / (|A| + |B| - |A ∩ B|), with |A| (target_size) already known from the
+    target-disease fetch. If species differs, subtract 0.1 (clamped at 0) before
+    ranking, so the penalty can change which breeds make the top 3.
+    Returns up to 3 breeds, built without re-validation (values come from our own SQL).
+    """
+    params = {"tid": target.id, "tsize": target_size, "tspecies": target.species}
+    return [
+        schemas.SimilarBreedSchema.model_construct(
+            name=r["name"], species=r["species"], similarity=round(float(r["similarity"]), 4)
+        )
+        for r in db.execute(_SIMILARITY_SQL, params).mappings()
+    ]
+
+
+class _SimilarityMatrix(NamedTuple):
+    breed_ids: "np.ndarray"
+    names: List[str]
+    species: "np.ndarray"
+    row_of: Dict[int, int]   # breed id -> row
+    matrix: "csr_matrix"     # breeds x diseases, 1 where linked
+    row_sums: "np.ndarray"   # diseases per breed
+
+
+def _load_similarity_matrix(db: Session):
+    breeds = db.execute(
+        select(models.Breed.id, models.Breed.name, models.Breed.species).order_by(models.Breed.id)
+    ).all()
+    if len(breeds) > _MATRIX_MAX_BREEDS:
+        return False
+    row_of = {b.id: i for i, b in enumerate(breeds)}
+    # Under read-committed, a breed committed between the two SELECTs can show up
+    # in the links but not in `breeds`; skip those rows. The catalog version was read
+    # before this load, so the next request reloads and picks them up.
+    links = [
+        (bid, did) for (bid, did) in db.execute(select(_link.breed_id, _link.disease_id))
+        if bid in row_of
+    ]
+
+    rows = np.fromiter((row_of[bid] for (bid, _did) in links), dtype=np.int64, count=len(links))
+    disease_ids = np.fromiter((did for (_bid, did) in links), dtype=np.int64, count=len(links))
+    _unique, cols = np.unique(disease_ids, return_inverse=True)
+    matrix = csr_matrix(
+        (np.ones(len(links)), (rows, cols.ravel())), shape=(len(breeds), len(_unique))
     )
-    return [(name, prev, did) for (name, prev, did) in q.all()]
-
-
-def _top_similar_breeds_via_sql(db: Session, target_breed_name: str) -> List[Tuple[str, str, float]]:
-    """
-    Uses a SQL query (close to the one given in the assignment) to compute Jaccard similarity
-    on shared diseases. Returns up to 3 rows: (name, species, similarity_raw).
-    """
-    sql = text(
-        """
-        SELECT b2.name AS name, b2.species AS species,
-               (SELECT COUNT(*)
-                FROM breed_disease_links l1
-                INNER JOIN breed_disease_links l2 ON l1.disease_id = l2.disease_id
-                WHERE l1.breed_id = b1.id AND l2.breed_id = b2.id) * 1.0 /
-               (SELECT COUNT(DISTINCT disease_id)
-                FROM breed_disease_links l
-                WHERE l.breed_id IN (b1.id, b2.id)) AS similarity
-        FROM breeds b1, breeds b2
-        WHERE b1.name = :target_breed AND b2.name != :target_breed
-        ORDER BY similarity DESC
-        LIMIT 3;
-        """
+    return _SimilarityMatrix(
+        breed_ids=np.array([b.id for b in breeds], dtype=np.int64),
+        names=[b.name for b in breeds],
+        species=np.array([b.species for b in breeds], dtype=object),
+        row_of=row_of,
+        matrix=matrix,
+        row_sums=np.asarray(matrix.sum(axis=1)).ravel(),
     )
-    rows = db.execute(sql, {"target_breed": target_breed_name}).fetchall()
-    # rows -> List[Row(name, species, similarity)]
-    return [(r.name, r.species, float(r.similarity) if r.similarity is not None else 0.0) for r in rows]
 
 
-def _apply_species_penalty(db: Session, target_species: str, sims: List[Tuple[str, str, float]]) -> List[Tuple[str, str, float]]:
+def _get_similarity_matrix(db: Session):
+    global _similarity_matrix
+    # version is read before loading: a breed committed mid-load leaves the stored
+    # version behind the data, so the next request reloads instead of going stale
+    version = _catalog_version(db)
+    with _cache_lock:
+        cached, generation = _similarity_matrix, _similarity_generation
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    m = _load_similarity_matrix(db)
+    with _cache_lock:
+        # don't publish a snapshot loaded before a concurrent invalidation
+        if _similarity_generation == generation:
+            _similarity_matrix = (version, m)
+    return m
+
+
+def invalidate_similarity_matrix() -> None:
+    """
+    Drops the in-process breed x disease matrix; the next analysis reloads it.
+    Other workers notice the change through the catalog version.
+    """
+    global _similarity_matrix, _similarity_generation
+    with _cache_lock:
+        _similarity_matrix = None
+        _similarity_generation += 1
+
+
+def _top_similar_breeds_via_matrix(db: Session, target: models.Breed) -> Optional[List[schemas.SimilarBreedSchema]]:
     """
-    If species differs, subtract 0.1; clamp to [0,1].
+    Same result as _top_similar_breeds_via_sql, computed with one sparse mat-vec
+    product over the cached matrix. Returns None when the matrix path is unavailable.
     """
-    adjusted = []
-    for (name, species, sim) in sims:
-        score = sim
-        if species != target_species:
-            score = max(0.0, sim - 0.1)
-        adjusted.append((name, species, round(score, 4)))
-    # keep order by score desc
-    adjusted.sort(key=lambda x: x[2], reverse=True)
-    return adjusted
+    if np is None:
+        return None
+    m = _get_similarity_matrix(db)
+    if not m or target.id not in m.row_of:
+        return None
+
+    t = m.row_of[target.id]
+    inter = (m.matrix @ m.matrix[t].T).toarray().ravel()
+    union = m.row_sums + m.row_sums[t] - inter
+    raw = np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+    score = np.where(m.species == target.species, raw, np.maximum(raw - 0.1, 0.0))
+    score[t] = -np.inf  # never suggest the target itself
+
+    # score desc, then breed id asc (same tie-break as the SQL query)
+    top = np.lexsort((m.breed_ids, -score))[:min(3, len(score) - 1)]
+    return [
+        schemas.SimilarBreedSchema.model_construct(
+            name=m.names[i], species=m.species[i], similarity=round(float(score[i]), 4)
+        )
+        for i in top
+    ]
 
 
 def _shared_diseases_with_top_breeds(
@@ -94,39 +297,56 @@ def _shared_diseases_with_top_breeds(
     """
     Returns the union of disease names shared between the target and any of the top similar breeds.
     """
-    if not top_breed_names:
+    if not target_disease_ids or not top_breed_names:
         return []
 
-    # get disease ids for each similar breed, take intersection with target, collect names
-    target_set = set(target_disease_ids)
-    shared_ids = set()
-
-    # map disease_id -> name
-    disease_map = {d.id: d.name for d in db.query(models.Disease).all()}
+    # single JOIN per chunk: intersection with the target is done by the DB via IN (...)
+    shared = set()
+    for chunk in _chunked(target_disease_ids, _IN_CHUNK_SIZE):
+        shared |= set(db.scalars(_SHARED_DISEASES_SQL, {"names": top_breed_names, "ids": chunk}))
+    return sorted(shared)
 
-    for bname in top_breed_names:
-        b = db.query(models.Breed).filter(models.Breed.name == bname).first()
-        if not b:
-            continue
-        their_ids = {
-            did for (did,) in db.query(models.BreedDiseaseLink.disease_id)
-            .filter(models.BreedDiseaseLink.breed_id == b.id).all()
-        }
-        shared_ids |= (their_ids & target_set)
 
-    return sorted([disease_map[did] for did in shared_ids])
+async def _generate_care_plan(breed_name: str, diseases_with_prev: List[Tuple[str, float]]) -> Tuple[str, bool]:
+    """
+    Returns (plan, degraded); degraded is True when the OpenAI call failed and the
+    rule-based plan was used instead, so callers don't cache it.
+    """
+    if not _openai_client or not os.getenv("OPENAI_API_KEY"):
+        return _fallback_plan(breed_name, diseases_with_prev), False
 
+    # small per-worker LRU: identical inputs recur across requests
+    diseases = sorted(diseases_with_prev)
+    key = (breed_name, tuple(diseases))
+    if key in _care_plan_cache:
+        _care_plan_cache.move_to_end(key)
+        return _care_plan_cache[key], False
 
-def _generate_care_plan(breed_name: str, diseases_with_prev: List[Tuple[str, float]]) -> str:
-    if not _openai_client or not os.getenv("OPENAI_API_KEY"):
-        return _fallback_plan(breed_name, diseases_with_prev)
     try:
-        # OpenAI call...
-        resp = _openai_client.chat.completions.create(...)
-        return resp.choices[0].message.content.strip()
+        prompt = (
+            f"Give 3 prevention bullets for {breed_name} given diseases "
+            f"{json.dumps(dict(diseases))} (name: prevalence). "
+            'Reply as JSON: {"bullets": [str, str, str]}'
+        )
+        resp = await _openai_client.chat.completions.create(
+            model="gpt-4o",
+            messages=[{"role": "user", "content": prompt}],
+            response_format={"type": "json_object"},
+            max_tokens=_CARE_PLAN_MAX_TOKENS,
+            temperature=0.2,
+        )
+        bullets = json.loads(resp.choices[0].message.content)["bullets"]
+        if not isinstance(bullets, list) or not all(isinstance(b, str) for b in bullets):
+            raise ValueError("care plan bullets must be a list of strings")
+        plan = f"Preventive care plan for {breed_name}:\n" + "\n".join(f"- {b}" for b in bullets)
     except Exception as e:
-        # Fallback if API quota error or any failure
-        return _fallback_plan(breed_name, diseases_with_prev)
+        # Fallback if API quota error or any failure (not cached, so the next request retries)
+        return _fallback_plan(breed_name, diseases_with_prev), True
+
+    _care_plan_cache[key] = plan
+    if len(_care_plan_cache) > _CARE_PLAN_CACHE_SIZE:
+        _care_plan_cache.popitem(last=False)
+    return plan, False
 
 def _fallback_plan(breed_name, diseases):
     bullets = [f"- {name}: monitor, vet checkups, lifestyle adjustments." for (name, _prev) in diseases]
@@ -135,33 +355,113 @@ def _fallback_plan(breed_name, diseases):
 
 
 
+# ---------- Cache ----------
+def _risk_cache_key(breed_name: str) -> str:
+    version = int(_redis_client.get(_RISK_CACHE_VERSION_KEY) or 0)
+    return f"risk:{breed_name}:v{version}"
+
+
+def _read_risk_cache(breed_name: str) -> Tuple[Optional[str], Optional[bytes]]:
+    """
+    Returns (key, cached_json); key is None when Redis is unavailable.
+    """
+    try:
+        key = _risk_cache_key(breed_name)
+        return key, _redis_client.get(key)
+    except Exception:
+        return None, None  # Redis down: serve uncached
+
+
+def _write_risk_cache(key: str, resp: schemas.RiskAnalysisResponseSchema) -> None:
+    try:
+        _redis_client.set(key, resp.model_dump_json(), ex=_RISK_CACHE_TTL)
+    except Exception:
+        pass
+
+
+def invalidate_risk_cache() -> None:
+    """
+    Bumps the cache version so every cached risk analysis is ignored (and expires via TTL).
+    Call after any change to breeds, diseases or links.
+    """
+    if not _redis_client:
+        return
+    try:
+        _redis_client.incr(_RISK_CACHE_VERSION_KEY)
+    except Exception:
+        pass  # cache is best-effort
+
+
 # ---------- Public service ----------
-def run_risk_analysis(db: Session, breed_name: str) -> schemas.RiskAnalysisResponseSchema:
+async def run_risk_analysis(db: Session, breed_name: str) -> schemas.RiskAnalysisResponseSchema:
+    key, cached = None, None
+    if _redis_client:
+        key, cached = await run_in_threadpool(_read_risk_cache, breed_name)
+    if cached:
+        return schemas.RiskAnalysisResponseSchema.model_validate_json(cached)
+
+    resp, degraded = await _compute_risk_analysis(db, breed_name)
+    if key and not degraded:
+        await run_in_threadpool(_write_risk_cache, key, resp)
+    return resp
+
+
+def _load_target(db: Session, breed_name: str) -> Tuple[models.Breed, List[Tuple[str, float, int]]]:
     # 1) Validate + get target breed
     target = _get_breed_by_name_or_404(db, breed_name)
 
     # 2) Get target diseases
     target_diseases = _fetch_target_diseases(db, target.id)  # [(name, prevalence, id), ...]
-    target_disease_ids = [did for (_n, _p, did) in target_diseases]
+    return target, target_diseases
 
-    # 3) Similarity (raw SQL) + apply species penalty
-    top_raw = _top_similar_breeds_via_sql(db, target.name)              # [(name, species, sim), ...]
-    top_adj = _apply_species_penalty(db, target.species, top_raw)       # penalized & sorted
+
+def _similar_and_shared(
+    db: Session, target: models.Breed, target_disease_ids: List[int]
+) -> Tuple[List[schemas.SimilarBreedSchema], List[str]]:
+    # 3) Similarity (in-process matrix if available, else SQL; species penalty applied before ranking)
+    top = _top_similar_breeds_via_matrix(db, target)
+    if top is None:
+        top = _top_similar_breeds_via_sql(db, target, len(target_disease_ids))
 
     # 4) Shared diseases (union across top similar breeds)
-    top_names = [t[0] for t in top_adj]
+    top_names = [b.name for b in top]
     shared = _shared_diseases_with_top_breeds(db, target_disease_ids, top_names)
+    return top, shared
+
+
+async def _compute_risk_analysis(db: Session, breed_name: str) -> Tuple[schemas.RiskAnalysisResponseSchema, bool]:
+    """
+    Returns (response, degraded); degraded responses carry a fallback care plan
+    caused by an OpenAI failure and must not be cached.
+    """
+    # DB work is sync, so it runs in the threadpool while the event loop awaits OpenAI
+    target, target_diseases = await run_in_threadpool(_load_target, db, breed_name)
+    target_disease_ids = [did for (_n, _p, did) in target_diseases]
 
-    # 5) Care plan via GPT-4o (or fallback)
-    care_plan = _generate_care_plan(target.name, [(n, p) for (n, p, _id) in target_diseases])
+    # No diseases -> nothing to compare or share; skip the similarity scan and the LLM
+    if not target_disease_ids:
+        return schemas.RiskAnalysisResponseSchema(
+            target_breed=target.name,
+            similar_breeds=[],
+            shared_diseases=[],
+            care_plan=_fallback_plan(target.name, []),
+        ), False
+
+    # 5) Care plan via GPT-4o (or fallback), overlapped with steps 3-4
+    care_task = asyncio.create_task(
+        _generate_care_plan(target.name, [(n, p) for (n, p, _id) in target_diseases])
+    )
+    try:
+        top, shared = await run_in_threadpool(_similar_and_shared, db, target, target_disease_ids)
+    except BaseException:
+        care_task.cancel()
+        raise
+    care_plan, degraded = await care_task
 
     # 6) Build response
     return schemas.RiskAnalysisResponseSchema(
         target_breed=target.name,
-        similar_breeds=[
-            schemas.SimilarBreedSchema(name=name, species=species, similarity=score)
-            for (name, species, score) in top_adj
-        ],
+        similar_breeds=top,
         shared_diseases=shared,
         care_plan=care_plan
-    )
+    ), degraded